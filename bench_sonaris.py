@@ -0,0 +1,68 @@
+"""
+Micro-benchmark of the geometry computation (Sonaris.compute_svector)
+
+Compares the vectorized lookup table computation with the former
+row-by-row loop for the 48, 96 and 128-beam ARIS configurations.
+compute_svector does not go through the geometry cache.
+
+Author(s) : Fabrice Zaoui (EDF R&D LNHE)
+
+Copyright EDF 2018
+"""
+import timeit
+import numpy as np
+from sonaris import Sonaris
+
+
+def row_loop(son):
+    # former implementation: one output row 'iy' at a time
+    # single precision window ranges, as in compute_svector
+    minRange = np.float32(son.frame_header['windowstart'])
+    maxRange = minRange + np.float32(son.frame_header['windowlength'])
+    nrows = son.m
+    half_angle = 14.
+    degtorad = np.pi / 180.
+    radtodeg = 180. / np.pi
+    d3 = minRange * np.float32(np.cos(half_angle*degtorad))
+    c1 = (nrows - 1) / np.float64(maxRange - minRange)
+    gamma = son.nx / np.float64(
+        np.float32(2) * maxRange * np.float32(np.sin(half_angle * degtorad)))
+    ny = np.int32(np.fix(gamma * np.float64(maxRange - d3) + 0.5))
+    svector = np.zeros((np.int32(son.nx*ny)), dtype=int)
+    ix = np.arange(1, son.nx + 1)
+    x = ((ix - 1) - son.nx / 2) / gamma
+    for iy in range(1, int(ny)+1):
+        y = maxRange - (iy-1)/gamma
+        r = np.sqrt(y*y + x*x)
+        theta = radtodeg * np.arctan2(x, y)
+        binnum = np.fix((r - minRange) * c1 + 1.5)
+        beamnum = son.lens_distorsion(son.nout, theta)
+        pos = (beamnum > 0) * (beamnum <= son.nout)*(binnum > 0) * \
+            (binnum <= nrows) * ((beamnum - 1) * nrows + binnum)
+        svector[(ix-1) * ny + iy - 1] = pos
+    svector[svector == 0] = 1
+    return svector
+
+
+def vectorized(son):
+    son.compute_svector()
+    return son.svector
+
+
+# (numbeams, samples per beam) of typical ARIS configurations
+configurations = [(48, 2000), (96, 2000), (128, 1500)]
+repeat = 5
+for numbeams, samples in configurations:
+    son = Sonaris('video_test.aris', 'bench.avi')
+    son.file_header = {'numbeams': numbeams, 'sampleperchannel': samples}
+    son.frame_header = {'windowstart': 0.6786, 'windowlength': 8.7}
+    son.angular_converter()
+    assert np.array_equal(vectorized(son), row_loop(son))
+    t_loop = min(timeit.repeat(lambda: row_loop(son),
+                               number=1, repeat=repeat))
+    t_vect = min(timeit.repeat(lambda: vectorized(son),
+                               number=1, repeat=repeat))
+    print('%3d beams, %4d samples (%4d x %4d pixels): loop %.4f s,'
+          ' vectorized %.4f s, speedup x%.1f'
+          % (numbeams, samples, son.nx, son.ny, t_loop, t_vect,
+             t_loop / t_vect))
@@ -14,6 +14,6 @@ __maintainer__ = "Fabrice Zaoui"
 __email__ = "fabrice.zaoui@edf.fr"
 __status__ = "Implementation"
 __version__ = "0.01"
-__all__ = ['Sonaris']
+__all__ = ['Sonaris', 'Session']
 
-from sonaris.sonaris import Sonaris
+from sonaris.sonaris import Sonaris, Session
@@ -0,0 +1,143 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+    Lossless concatenation of AVI files
+
+    Author(s): Fabrice Zaoui
+
+    Copyright EDF 2018
+
+    Comments :
+    - the compressed frames of the input files are copied as they are
+      (no decoding), in the order of the files
+    - the input files are standard AVI files (RIFF 'AVI ' with an 'idx1'
+      index) written with the same codec and frame size, each one starting
+      with a key frame, e.g. the segments written by cv2.VideoWriter
+    - the output is a standard AVI file, limited to 4 GB
+"""
+
+import struct
+import numpy as np
+
+# entry of the legacy AVI index
+IDX1 = np.dtype([
+    # chunk identifier
+    ('ckid', 'S4'),
+    # AVIIF_KEYFRAME, ...
+    ('flags', '<u4'),
+    # offset of the chunk from the 'movi' identifier
+    ('offset', '<u4'),
+    # size of the chunk data
+    ('size', '<u4'),
+])
+
+# maximum size of a standard (RIFF) AVI file
+AVI_MAX_SIZE = 0xFFFFFFFF
+
+
+def read_avi(filename):
+    # 'hdrl' list (bytes) and chunks of the 'movi' list of an AVI file:
+    # identifier, position of the data, size and flags of each chunk
+    with open(filename, 'rb') as f:
+        riff, size, form = struct.unpack('<4sI4s', f.read(12))
+        if riff != b'RIFF' or form != b'AVI ':
+            raise IOError(filename + ' is not an AVI file')
+        end = 8 + size
+        hdrl = None
+        chunks = []
+        index = None
+        while f.tell() + 8 <= end:
+            fourcc, size = struct.unpack('<4sI', f.read(8))
+            start = f.tell()
+            if fourcc == b'LIST':
+                listtype = f.read(4)
+                if listtype == b'hdrl':
+                    f.seek(start - 8)
+                    hdrl = bytearray(f.read(size + 8))
+                elif listtype == b'movi':
+                    chunks = read_movi(f, start + 4, start + size)
+            elif fourcc == b'idx1':
+                index = np.frombuffer(f.read(size), dtype=IDX1)
+            f.seek(start + size + (size & 1))
+        # OpenDML extensions ('RIFF AVIX') are not supported
+        if f.read(4) == b'RIFF':
+            raise IOError(filename + ': OpenDML AVI files are not supported')
+    if hdrl is None:
+        raise IOError(filename + ': no AVI header')
+    if index is None or len(index) != len(chunks):
+        raise IOError(filename + ': missing or inconsistent AVI index')
+    for chunk, flags in zip(chunks, index['flags']):
+        chunk[3] = int(flags)
+    return hdrl, chunks
+
+
+def read_movi(f, start, end):
+    chunks = []
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        ckid, size = struct.unpack('<4sI', f.read(8))
+        if ckid == b'LIST':
+            # 'rec ' lists: their chunks are read in place
+            pos += 12
+            continue
+        chunks.append([ckid, pos + 8, size, 0])
+        pos += 8 + size + (size & 1)
+    return chunks
+
+
+def set_frame_count(hdrl, nbframe, bufsize):
+    # total frames of the main header, length of the video stream and
+    # suggested buffer sizes (largest chunk)
+    pos = 12
+    while pos + 8 <= len(hdrl):
+        ckid, size = struct.unpack_from('<4sI', hdrl, pos)
+        if ckid == b'LIST':
+            pos += 12
+            continue
+        if ckid == b'avih':
+            struct.pack_into('<I', hdrl, pos + 8 + 16, nbframe)
+            struct.pack_into('<I', hdrl, pos + 8 + 28, bufsize)
+        elif ckid == b'strh' and hdrl[pos+8:pos+12] == b'vids':
+            struct.pack_into('<I', hdrl, pos + 8 + 32, nbframe)
+            struct.pack_into('<I', hdrl, pos + 8 + 36, bufsize)
+        pos += 8 + size + (size & 1)
+
+
+def concat_avi(segments, avi_file):
+    # concatenate the AVI files 'segments' into 'avi_file'
+    parts = [read_avi(filename) for filename in segments]
+    hdrl = parts[0][0]
+    nbframe = sum([1 for _, chunks in parts for chunk in chunks
+                   if chunk[0][2:] in (b'dc', b'db')])
+    bufsize = max([chunk[2] for _, chunks in parts for chunk in chunks] +
+                  [0])
+    set_frame_count(hdrl, nbframe, bufsize)
+    with open(avi_file, 'wb') as out:
+        out.write(b'RIFF\0\0\0\0AVI ')
+        out.write(hdrl)
+        movi = out.tell()
+        out.write(b'LIST\0\0\0\0movi')
+        index = []
+        for filename, (_, chunks) in zip(segments, parts):
+            with open(filename, 'rb') as f:
+                for ckid, pos, size, flags in chunks:
+                    index.append((ckid, flags, out.tell() - (movi + 8), size))
+                    f.seek(pos)
+                    out.write(struct.pack('<4sI', ckid, size))
+                    out.write(f.read(size))
+                    if size & 1:
+                        out.write(b'\0')
+        endmovi = out.tell()
+        index = np.array(index, dtype=IDX1)
+        out.write(struct.pack('<4sI', b'idx1', index.nbytes))
+        out.write(index.tobytes())
+        total = out.tell()
+        if total > AVI_MAX_SIZE:
+            raise IOError(avi_file + ': the 4 GB limit of an AVI file'
+                          ' is exceeded')
+        out.seek(4)
+        out.write(struct.pack('<I', total - 8))
+        out.seek(movi + 4)
+        out.write(struct.pack('<I', endmovi - movi - 8))
+    return
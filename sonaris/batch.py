@@ -0,0 +1,235 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+    Batch conversion of directories of ARIS files
+
+    Author(s): Fabrice Zaoui
+
+    Copyright EDF 2018
+
+    Comments :
+    - the jobs are sorted by file size (largest first) and run on a pool
+      of processes
+    - a failed conversion is reported and does not stop the batch
+    - with a manifest (JSON file), the completed conversions are recorded
+      with the size and modification time of their ARIS file, so that a
+      rerun only converts the new, changed or missing outputs
+
+    Usage :
+        python -m sonaris.batch /data/aris -o /data/avi -p 4 \
+            --manifest /data/avi/manifest.json
+"""
+
+import os
+import sys
+import glob
+import time
+import json
+import argparse
+import traceback
+import multiprocessing
+from sonaris.sonaris import Sonaris
+
+
+def find_files(source, pattern='*.aris'):
+    # ARIS files of a directory, of a glob pattern or of a list of files
+    if isinstance(source, (list, tuple)):
+        return list(source)
+    if os.path.isdir(source):
+        return glob.glob(os.path.join(source, pattern))
+    return glob.glob(source)
+
+
+def file_size(aris_file):
+    # size of an ARIS file, -1 if it cannot be read (the job then fails
+    # and is reported)
+    try:
+        return os.path.getsize(aris_file)
+    except OSError:
+        return -1
+
+
+def make_jobs(files, out_dir=None):
+    # (ARIS file, AVI file) jobs, largest ARIS files first
+    jobs = []
+    for aris_file in sorted(files, key=file_size, reverse=True):
+        avi_dir = os.path.dirname(aris_file) if out_dir is None else out_dir
+        name = os.path.splitext(os.path.basename(aris_file))[0] + '.avi'
+        jobs.append((aris_file, os.path.join(avi_dir, name)))
+    return jobs
+
+
+def fingerprint(aris_file):
+    # identification of the content of an ARIS file
+    stat = os.stat(aris_file)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def load_manifest(filename):
+    # completed jobs: {ARIS file: {'avi_file', 'size', 'mtime', ...}}
+    if filename is None or not os.path.isfile(filename):
+        return {}
+    with open(filename) as f:
+        return json.load(f)
+
+
+def save_manifest(filename, manifest):
+    # atomic write: a batch killed while saving keeps the previous manifest
+    tmpname = filename + '.tmp'
+    with open(tmpname, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmpname, filename)
+
+
+def is_completed(job, manifest):
+    # same ARIS file content and output still present
+    aris_file, avi_file = job
+    entry = manifest.get(os.path.abspath(aris_file))
+    if entry is None or entry['avi_file'] != os.path.abspath(avi_file):
+        return False
+    try:
+        current = fingerprint(aris_file)
+    except OSError:
+        return False
+    if entry['size'] != current['size'] or \
+            entry['mtime'] != current['mtime']:
+        return False
+    return os.path.isfile(avi_file)
+
+
+def convert_job(job, cache_dir=None, options=None):
+    # conversion of one file: never raises, returns its status
+    aris_file, avi_file = job
+    status = {'aris_file': aris_file, 'avi_file': avi_file,
+              'status': 'ok', 'error': None, 'size': 0, 'mtime': None}
+    start = time.time()
+    try:
+        # fingerprint taken before the conversion
+        status.update(fingerprint(aris_file))
+        Sonaris(aris_file, avi_file, cache_dir).convert(**(options or {}))
+        if not os.path.isfile(avi_file) or os.path.getsize(avi_file) == 0:
+            raise IOError('no video written')
+    except Exception as error:
+        status['status'] = 'failed'
+        status['error'] = '%s: %s' % (type(error).__name__, error)
+        status['traceback'] = traceback.format_exc()
+        # no partial video for a failed conversion
+        try:
+            if os.path.isfile(avi_file):
+                os.remove(avi_file)
+        except OSError:
+            pass
+    status['seconds'] = time.time() - start
+    status['throughput'] = status['size'] / 1e6 / max(status['seconds'],
+                                                      1e-9)
+    return status
+
+
+def _convert_job(args):
+    return convert_job(*args)
+
+
+def report(status, out=sys.stdout):
+    if status['status'] == 'skipped':
+        out.write('skipped %s (already converted)\n' % status['aris_file'])
+    elif status['status'] == 'ok':
+        out.write('ok      %s -> %s (%.1f MB in %.1f s, %.1f MB/s)\n'
+                  % (status['aris_file'], status['avi_file'],
+                     status['size'] / 1e6, status['seconds'],
+                     status['throughput']))
+    else:
+        out.write('FAILED  %s (%s)\n' % (status['aris_file'],
+                                         status['error']))
+    out.flush()
+
+
+def run(source, out_dir=None, processes=None, pattern='*.aris',
+        cache_dir=None, manifest=None, verbose=True, **options):
+    # convert all the ARIS files of 'source' (directory, glob pattern or
+    # list of files) into AVI files of 'out_dir' (default: next to the ARIS
+    # files) on a pool of 'processes' processes; 'options' are given to
+    # Sonaris.convert. The jobs already completed in the 'manifest' file
+    # are skipped. Returns the status of every job.
+    # The 'workers' and 'segments' options start processes of their own,
+    # which the (daemonic) processes of a pool cannot do: they require
+    # processes=1, the jobs being then run one after the other in the
+    # current process
+    if (options.get('workers', 1) > 1 or options.get('segments', 1) > 1) \
+            and processes != 1:
+        raise ValueError("the 'workers' and 'segments' options of"
+                         " Sonaris.convert require processes=1")
+    jobs = make_jobs(find_files(source, pattern), out_dir)
+    if out_dir is not None and not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    completed = load_manifest(manifest)
+    start = time.time()
+    results = []
+    todo = []
+    for job in jobs:
+        if not is_completed(job, completed):
+            todo.append(job)
+            continue
+        status = {'aris_file': job[0], 'avi_file': job[1],
+                  'status': 'skipped', 'error': None}
+        results.append(status)
+        if verbose:
+            report(status)
+    tasks = [(job, cache_dir, options) for job in todo]
+    pool = None
+    if processes == 1:
+        statuses = map(_convert_job, tasks)
+    else:
+        pool = multiprocessing.Pool(processes)
+        statuses = pool.imap_unordered(_convert_job, tasks)
+    try:
+        for status in statuses:
+            results.append(status)
+            if verbose:
+                report(status)
+            if manifest is not None and status['status'] == 'ok':
+                completed[os.path.abspath(status['aris_file'])] = {
+                    'avi_file': os.path.abspath(status['avi_file']),
+                    'size': status['size'], 'mtime': status['mtime'],
+                    'completed': time.strftime('%Y-%m-%d %H:%M:%S')}
+                save_manifest(manifest, completed)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    if verbose:
+        seconds = time.time() - start
+        done = [status for status in results
+                if status['status'] != 'skipped']
+        size = sum([status['size'] for status in done])
+        failed = [status for status in done if status['status'] != 'ok']
+        print('%d files, %d converted, %d skipped, %d failed,'
+              ' %.1f MB in %.1f s (%.1f MB/s)'
+              % (len(results), len(done) - len(failed),
+                 len(results) - len(done), len(failed), size / 1e6, seconds,
+                 size / 1e6 / max(seconds, 1e-9)))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Batch conversion of ARIS files into AVI files')
+    parser.add_argument('source', help='directory or glob of ARIS files')
+    parser.add_argument('-o', '--out-dir', default=None,
+                        help='output directory (default: next to the inputs)')
+    parser.add_argument('-p', '--processes', type=int, default=None,
+                        help='number of processes (default: all the CPUs)')
+    parser.add_argument('--pattern', default='*.aris',
+                        help='file pattern in a source directory')
+    parser.add_argument('--cache-dir', default=None,
+                        help='on-disk cache of the sonar geometries')
+    parser.add_argument('--manifest', default=None,
+                        help='JSON file of the completed conversions'
+                        ' (resumable batch)')
+    args = parser.parse_args(argv)
+    results = run(args.source, args.out_dir, args.processes, args.pattern,
+                  args.cache_dir, args.manifest)
+    return int(any([status['status'] == 'failed' for status in results]))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,157 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+    Fast catalog of an archive of ARIS files
+
+    Author(s): Fabrice Zaoui
+
+    Copyright EDF 2018
+
+    Comments :
+    - only the file header and the first frame header of each file are
+      read (2048 bytes, one read per file), files are scanned in parallel
+    - the catalog is a columnar index written as a NumPy .npz file (one
+      array per column) or as a CSV file
+
+    Usage :
+        python -m sonaris.catalog /data/aris -o /data/catalog.npz -p 8
+"""
+
+import os
+import sys
+import csv
+import argparse
+import multiprocessing
+import numpy as np
+from sonaris.sonaris import FILE_HEADER, FRAME_HEADER
+from sonaris.batch import find_files
+
+# columns of the catalog
+CATALOG = np.dtype([
+    ('path', 'U1024'),
+    # size of the ARIS file in bytes
+    ('filesize', np.uint64),
+    ('version', np.uint8),
+    ('numframes', np.uint32),
+    ('numbeams', np.uint32),
+    # samples per beam (first frame)
+    ('samples', np.uint32),
+    # frame rate (first frame)
+    ('framerate', np.float32),
+    # date that file was recorded
+    ('date', 'U32'),
+    # time of the first frame (microseconds since 1970)
+    ('frametime', np.uint64),
+    ('serialnumber', np.uint32),
+    # window range in meters (first frame)
+    ('windowstart', np.float32),
+    ('windowlength', np.float32),
+    # empty if the headers were read
+    ('error', 'U256'),
+])
+
+
+def read_entry(aris_file):
+    # catalog row of an ARIS file from its file and first frame headers
+    entry = np.zeros((), dtype=CATALOG)
+    entry['path'] = aris_file
+    try:
+        with open(aris_file, 'rb') as f:
+            data = f.read(FILE_HEADER.itemsize + FRAME_HEADER.itemsize)
+        entry['filesize'] = os.path.getsize(aris_file)
+    except (IOError, OSError) as error:
+        entry['error'] = str(error)
+        return entry
+    if len(data) < FILE_HEADER.itemsize:
+        entry['error'] = 'truncated file header'
+        return entry
+    header = np.frombuffer(data, dtype=FILE_HEADER, count=1)[0]
+    for name in ('version', 'numframes', 'numbeams', 'serialnumber'):
+        entry[name] = header[name]
+    entry['date'] = header['strdate'].tobytes().decode('latin-1') \
+        .rstrip('\0')
+    entry['samples'] = header['sampleperchannel']
+    if header['optionalheadersize'] > 0:
+        # first frame header after the optional header
+        try:
+            with open(aris_file, 'rb') as f:
+                f.seek(FILE_HEADER.itemsize +
+                       int(header['optionalheadersize']))
+                data = data[:FILE_HEADER.itemsize] + \
+                    f.read(FRAME_HEADER.itemsize)
+        except (IOError, OSError) as error:
+            entry['error'] = str(error)
+            return entry
+    if len(data) < FILE_HEADER.itemsize + FRAME_HEADER.itemsize:
+        entry['error'] = 'no frame header'
+        return entry
+    frame = np.frombuffer(data, dtype=FRAME_HEADER, count=1,
+                          offset=FILE_HEADER.itemsize)[0]
+    # samples per beam of the frame header, else of the file header (as
+    # Sonaris.frame_shape)
+    if frame['samplesperbeam'] > 0:
+        entry['samples'] = frame['samplesperbeam']
+    for name in ('framerate', 'frametime', 'windowstart', 'windowlength'):
+        entry[name] = frame[name]
+    return entry
+
+
+def scan(source, processes=None, pattern='*.aris', chunksize=64):
+    # catalog (structured array) of the ARIS files of 'source' (directory,
+    # glob pattern or list of files) read by a pool of processes
+    files = sorted(find_files(source, pattern))
+    pool = multiprocessing.Pool(processes)
+    try:
+        entries = pool.map(read_entry, files, chunksize=chunksize)
+    finally:
+        pool.terminate()
+        pool.join()
+    return np.array(entries, dtype=CATALOG)
+
+
+def save(catalog, filename):
+    # columnar index: .csv file or .npz file (one array per column)
+    if filename.endswith('.csv'):
+        with open(filename, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(catalog.dtype.names)
+            for entry in catalog:
+                writer.writerow(entry.tolist())
+    else:
+        columns = {name: catalog[name] for name in catalog.dtype.names}
+        # string columns stored at the width of their longest value
+        for name in ('path', 'date', 'error'):
+            columns[name] = np.array(catalog[name].tolist(), dtype=str)
+        np.savez(filename, **columns)
+    return
+
+
+def load(filename):
+    # catalog saved as a .npz file
+    with np.load(filename) as columns:
+        catalog = np.zeros(len(columns['path']), dtype=CATALOG)
+        for name in CATALOG.names:
+            catalog[name] = columns[name]
+    return catalog
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Catalog of the headers of ARIS files')
+    parser.add_argument('source', help='directory or glob of ARIS files')
+    parser.add_argument('-o', '--output', default='catalog.npz',
+                        help='catalog file (.npz or .csv)')
+    parser.add_argument('-p', '--processes', type=int, default=None,
+                        help='number of processes (default: all the CPUs)')
+    parser.add_argument('--pattern', default='*.aris',
+                        help='file pattern in a source directory')
+    args = parser.parse_args(argv)
+    catalog = scan(args.source, args.processes, args.pattern)
+    save(catalog, args.output)
+    print('%d files, %d unreadable -> %s'
+          % (len(catalog), np.count_nonzero(catalog['error']), args.output))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -14,529 +14,744 @@
 """
 
 import os
+import time
+import bisect
+import shutil
+import datetime
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue, Empty, Full
+from collections import OrderedDict, deque
 import numpy as np
-from PIL import Image
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
 from cv2 import VideoWriter, VideoWriter_fourcc, imread, resize
+from cv2 import cvtColor, COLOR_GRAY2BGR
+from sonaris.avi import concat_avi
+
+# ARIS v5 file header (1024 bytes)
+FILE_HEADER = np.dtype([
+    # type de fichier
+    ('type', np.uint8, 3),
+    # version
+    ('version', np.uint8),
+    # total frames in file
+    ('numframes', np.uint32),
+    # initial recorded frame rate
+    ('framerate', np.uint32),
+    # Non-zero if HF, zero if LF
+    ('resolution', np.uint32),
+    # ARIS 3000 = 128/64, ARIS 1800 = 96/48, ARIS 1200 = 48
+    ('numbeams', np.uint32),
+    # 1/Sample Period
+    ('samplerate', np.float32),
+    # number of range samples in each beam
+    ('sampleperchannel', np.uint32),
+    # relative gain in dB:  0 - 40
+    ('receivergain', np.uint32),
+    # image window start range in meters (code [0..31] in DIDSON)
+    ('windowstart', np.float32),
+    # image window length in meters  (code [0..3] in DIDSON)
+    ('windowlength', np.float32),
+    # non-zero = lens down (DIDSON) or lens up (ARIS),
+    # zero = opposite
+    ('reverse', np.uint32),
+    # sonar serial number
+    ('serialnumber', np.uint32),
+    # date that file was recorded
+    ('strdate', np.uint8, 32),
+    # user input to identify file in 256 characters
+    ('idstring', np.uint8, 256),
+    # user-defined integer quantity
+    ('id1', np.int32),
+    # user-defined integer quantity
+    ('id2', np.int32),
+    # user-defined integer quantity
+    ('id3', np.int32),
+    # user-defined integer quantity
+    ('id4', np.int32),
+    # first frame number from source file
+    # (for DIDSON snippet files)
+    ('startframe', np.uint32),
+    # last frame number from source file (for DIDSON snippet files)
+    ('endframe', np.uint32),
+    # non-zero indicates time lapse recording
+    ('timelapse', np.uint32),
+    # number of frames/seconds between recorded frames
+    ('recordinterval', np.uint32),
+    # frames or seconds interval
+    ('radioseconds', np.uint32),
+    # record every Nth frame
+    ('frameinterval', np.uint32),
+    # see DDF_04 file format document
+    ('flags', np.uint32),
+    # see DDF_04 file format document
+    ('auxflags', np.uint32),
+    # sound velocity in water
+    ('sspd', np.uint32),
+    # see DDF_04 file format document
+    ('flags3d', np.uint32),
+    # DIDSON software version that recorded the file
+    ('softwareversion', np.uint32),
+    # water temperature code:  0 = 5-15C, 1 = 15-25C, 2 = 25-35C
+    ('watertemperature', np.uint32),
+    # salinity code:  0 = fresh, 1 = brackish, 2 = salt
+    ('salinity', np.uint32),
+    # added for ARIS but not used
+    ('pulselength', np.uint32),
+    # added for ARIS but not used
+    ('txmode', np.uint32),
+    # reserved for future use
+    ('versionfgpa', np.uint32),
+    # reserved for future use
+    ('versionpsuc', np.uint32),
+    # frame index of frame used for thumbnail image of file
+    ('thumbnailfi', np.uint32),
+    # total file size in bytes
+    ('filesize', np.uint64),
+    # reserved for future use
+    ('optionalheadersize', np.uint64),
+    # reserved for future use
+    ('optionaltailsize', np.uint64),
+    # DIDSON version minor
+    ('versionminor', np.uint32),
+    # non-zero if telephoto lens
+    # (large lens, hi-res lens, big lens) is present
+    ('largelens', np.uint32),
+    # free space for user
+    ('userassigned', np.uint8, 568),
+])
+
+
+# ARIS v5 frame header (1024 bytes)
+FRAME_HEADER = np.dtype([
+    ('framenumber', np.uint32),
+    ('frametime', np.uint64),
+    ('version', np.uint32),
+    ('status', np.uint32),
+    ('sonartimestep', np.uint64),
+    ('tsday', np.uint32),
+    ('tshour', np.uint32),
+    ('tsminute', np.uint32),
+    ('tssecond', np.uint32),
+    ('tshsecond', np.uint32),
+    ('transmitmode', np.uint32),
+    ('windowstart', np.float32),
+    ('windowlength', np.float32),
+    ('threshold', np.uint32),
+    ('intensity', np.int32),
+    ('receivergain', np.uint32),
+    ('degc1', np.uint32),
+    ('degc2', np.uint32),
+    ('humidity', np.uint32),
+    ('focus', np.uint32),
+    ('battery', np.uint32),
+    ('uservalue1', np.float32),
+    ('uservalue2', np.float32),
+    ('uservalue3', np.float32),
+    ('uservalue4', np.float32),
+    ('uservalue5', np.float32),
+    ('uservalue6', np.float32),
+    ('uservalue7', np.float32),
+    ('uservalue8', np.float32),
+    ('velocity', np.float32),
+    ('depth', np.float32),
+    ('altitude', np.float32),
+    ('pitch', np.float32),
+    ('pitchrate', np.float32),
+    ('roll', np.float32),
+    ('rollrate', np.float32),
+    ('heading', np.float32),
+    ('headingrate', np.float32),
+    ('compassheading', np.float32),
+    ('compasspitch', np.float32),
+    ('compassroll', np.float32),
+    ('latitude', np.float64),
+    ('longitude', np.float64),
+    ('sonarposition', np.float32),
+    ('configflags', np.uint32),
+    ('beamtilt', np.float32),
+    ('targetrange', np.float32),
+    ('targetbearing', np.float32),
+    ('targetpresent', np.uint32),
+    ('firmwareversion', np.uint32),
+    ('flags', np.uint32),
+    ('sourceframe', np.uint32),
+    ('watertemp', np.float32),
+    ('timerperiod', np.uint32),
+    ('sonarx', np.float32),
+    ('sonary', np.float32),
+    ('sonarz', np.float32),
+    ('sonarpan', np.float32),
+    ('sonartilt', np.float32),
+    ('sonarroll', np.float32),
+    ('panpnnl', np.float32),
+    ('tiltpnnl', np.float32),
+    ('rollpnnl', np.float32),
+    ('vehicletime', np.float64),
+    ('timeggk', np.float32),
+    ('dateggk', np.uint32),
+    ('qualityggk', np.uint32),
+    ('numsatsggk', np.uint32),
+    ('dopggk', np.float32),
+    ('ehtggk', np.float32),
+    ('heavetss', np.float32),
+    ('yeargps', np.uint32),
+    ('monthgps', np.uint32),
+    ('daygps', np.uint32),
+    ('hourgps', np.uint32),
+    ('minutegps', np.uint32),
+    ('secondgps', np.uint32),
+    ('hsecondgps', np.uint32),
+    ('sonarpanoffset', np.float32),
+    ('sonartiltoffset', np.float32),
+    ('sonarrolloffset', np.float32),
+    ('sonarxoffset', np.float32),
+    ('sonaryoffset', np.float32),
+    ('sonarzoffset', np.float32),
+    ('tmatrix', np.float32, 16),
+    ('samplerate', np.float32),
+    ('accellx', np.float32),
+    ('accelly', np.float32),
+    ('accellz', np.float32),
+    ('pingmode', np.uint32),
+    ('frequencyhilow', np.uint32),
+    ('pulsewidth', np.uint32),
+    ('cycleperiod', np.uint32),
+    ('sampleperiod', np.uint32),
+    ('transmitenable', np.float32),
+    ('framerate', np.float32),
+    ('soundspeed', np.float32),
+    ('samplesperbeam', np.uint32),
+    ('enable150v', np.uint32),
+    ('samplestartdelay', np.uint32),
+    ('largelens', np.uint32),
+    ('thesystemtype', np.uint32),
+    ('sonarserianumber', np.uint32),
+    ('encryptedkey', np.uint64),
+    ('ariserrorflagsuint', np.uint32),
+    ('missedpackets', np.uint32),
+    ('arisappversion', np.uint32),
+    ('available2', np.uint32),
+    ('reorderedsamples', np.uint32),
+    ('salinity', np.uint32),
+    ('pressure', np.float32),
+    ('batteryvoltage', np.float32),
+    ('mainvoltage', np.float32),
+    ('switchvoltage', np.float32),
+    ('focusmotormoving', np.uint32),
+    ('voltagechanging', np.uint32),
+    ('focustimeoutfault', np.uint32),
+    ('focusovercurrentfault', np.uint32),
+    ('focusnotfoundfault', np.uint32),
+    ('focusstalledfault', np.uint32),
+    ('fpgatimeoutfault', np.uint32),
+    ('fpgabusyfault', np.uint32),
+    ('fpgastuckfault', np.uint32),
+    ('cputempfault', np.uint32),
+    ('psutempfault', np.uint32),
+    ('watertempfault', np.uint32),
+    ('humidityfault', np.uint32),
+    ('pressurefault', np.uint32),
+    ('voltagereadfault', np.uint32),
+    ('voltagewritefault', np.uint32),
+    ('focuscurrentposition', np.uint32),
+    ('targetpan', np.float32),
+    ('targettilt', np.float32),
+    ('targetroll', np.float32),
+    ('panmotorerrorcode', np.uint32),
+    ('tiltmotorerrorcode', np.uint32),
+    ('rollmotorerrorcode', np.uint32),
+    ('panabsposition', np.float32),
+    ('tiltabsposition', np.float32),
+    ('rollabsposition', np.float32),
+    ('panaccelx', np.float32),
+    ('panaccely', np.float32),
+    ('panaccelz', np.float32),
+    ('tiltaccelx', np.float32),
+    ('tiltaccely', np.float32),
+    ('tiltaccelz', np.float32),
+    ('rollaccelx', np.float32),
+    ('rollaccely', np.float32),
+    ('rollaccelz', np.float32),
+    ('appliedsettings', np.uint32),
+    ('constrainedsettings', np.uint32),
+    ('invalidsettings', np.uint32),
+    ('enableinterpacketdelay', np.uint32),
+    ('interpacketdelayperiod', np.uint32),
+    ('uptime', np.uint32),
+    ('arisappversionmajor', np.uint16),
+    ('arisappversionminor', np.uint16),
+    ('gotime', np.uint64),
+    ('panvelocity', np.float32),
+    ('tiltvelocity', np.float32),
+    ('rollvelocity', np.float32),
+    ('sentinel', np.uint32),
+    ('userassigned', np.uint8, 292),
+])
+
+# value of the 'sentinel' field of a valid frame header
+FRAME_SENTINEL = 0xDABBAD00
+
+
+def ordered_frames(numbers, positions):
+    # mask of the largest set of frames whose frame numbers grow at least
+    # as fast as their positions in the file (longest non-decreasing
+    # subsequence of framenumber - position): dropped frames are allowed
+    # and a frame number out of order only excludes its own frame
+    shift = (np.asarray(numbers, dtype=np.int64) -
+             np.asarray(positions, dtype=np.int64)).tolist()
+    # smallest last shift and last frame of the subsequences of each length
+    tails = []
+    ends = []
+    previous = [-1] * len(shift)
+    for i, value in enumerate(shift):
+        k = bisect.bisect_right(tails, value)
+        if k == len(tails):
+            tails.append(value)
+            ends.append(i)
+        else:
+            tails[k] = value
+            ends[k] = i
+        previous[i] = ends[k-1] if k > 0 else -1
+    mask = np.zeros(len(shift), dtype=bool)
+    i = ends[-1] if ends else -1
+    while i >= 0:
+        mask[i] = True
+        i = previous[i]
+    return mask
+
+
+# entry of the frame index (.idx sidecar file of an ARIS file)
+FRAME_INDEX = np.dtype([
+    # position of the frame header in the ARIS file
+    ('offset', np.uint64),
+    ('framenumber', np.uint32),
+    # frame time in microseconds since 1970
+    ('frametime', np.uint64),
+    # sonar window of the frame in meters
+    ('windowstart', np.float32),
+    ('windowlength', np.float32),
+])
+
+
+# character fields of the headers, decoded as strings
+STRING_FIELDS = ('type', 'strdate', 'idstring')
+
+
+def decode_header(record):
+    # convert a structured header record to a dictionary of scalars
+    # (strings for the character fields, arrays for the vector fields)
+    header = {}
+    for name in record.dtype.names:
+        value = record[name]
+        if name in STRING_FIELDS:
+            header[name] = value.tobytes().decode('latin-1')
+        elif value.ndim > 0:
+            header[name] = np.array(value)
+        else:
+            header[name] = value.item()
+    return header
+
+
+# number of sonar geometries (svector lookup tables) kept in memory
+GEOMETRY_CACHE_SIZE = 16
+_geometry_cache = OrderedDict()
+
+
+def geometry_key(numbeams, samples, windowstart, windowlength):
+    # the svector lookup table only depends on these parameters
+    # (window ranges are single precision values in the ARIS headers)
+    return (int(numbeams), int(samples),
+            float(np.float32(windowstart)), float(np.float32(windowlength)))
+
+
+def geometry_file(key, cache_dir):
+    # name of the on-disk cache file of a sonar geometry
+    return os.path.join(cache_dir, 'svector_%d_%d_%.9g_%.9g.npy' % key)
+
+
+def remap_operator(key, svector):
+    # fuse the 4x beam interpolation and the svector gather into one
+    # linear operator from the raw samples (samples, beams) of a frame to
+    # the (ny, nx) output image: each pixel is the weighted sum of two raw
+    # samples, given by a pair of flat indices and a pair of weights
+    n, m = key[0], key[1]
+    nx, ny = svector.shape
+    # zero-based offsets in the interpolated frame (column-major order)
+    pos = svector.T.ravel() - 1
+    col, row = np.divmod(pos, m)
+    # interpolated column 4*k+j lies between the beams k and k+1
+    k, j = np.divmod(col, 4)
+    index = np.empty((2, nx * ny), dtype=np.intp)
+    weight = np.empty((2, nx * ny), dtype=np.float32)
+    # the beams are in reverse order in the raw frame
+    index[0] = row * n + (n - 1 - k)
+    index[1] = row * n + (n - 1 - np.minimum(k + 1, n - 1))
+    weight[1] = j / 4.
+    weight[0] = 1. - weight[1]
+    # black fill
+    weight[:, pos == 0] = 0.
+    return {'svector': svector, 'nx': nx, 'ny': ny,
+            'index': index, 'weight': weight}
+
+
+def load_geometry(key, cache_dir=None):
+    # geometry of a sonar configuration from the in-process LRU cache,
+    # then from the on-disk cache (svector stored as a (nx, ny) array)
+    if key in _geometry_cache:
+        _geometry_cache.move_to_end(key)
+        return _geometry_cache[key]
+    if cache_dir is None:
+        return None
+    try:
+        svector = np.load(geometry_file(key, cache_dir))
+    except (IOError, ValueError):
+        return None
+    geometry = remap_operator(key, svector)
+    store_geometry(key, geometry)
+    return geometry
+
+
+def store_geometry(key, geometry, cache_dir=None):
+    _geometry_cache[key] = geometry
+    _geometry_cache.move_to_end(key)
+    while len(_geometry_cache) > GEOMETRY_CACHE_SIZE:
+        _geometry_cache.popitem(last=False)
+    if cache_dir is None:
+        return
+    filename = geometry_file(key, cache_dir)
+    if os.path.isfile(filename):
+        return
+    # atomic write (the cache directory may be shared by several processes)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmpname = '%s.%d.tmp' % (filename, os.getpid())
+        with open(tmpname, 'wb') as f:
+            np.save(f, geometry['svector'])
+        os.replace(tmpname, filename)
+    except (IOError, OSError):
+        print('Warning ->store_geometry<- : unable to write the cache file '
+              + filename)
+
+
+# work buffers of the remap, allocated once per thread and geometry and
+# reused from one block of frames to the next
+_workspace = threading.local()
+# maximum number of frames remapped at once (size of the work buffers)
+REMAP_BLOCK = 4
+
+
+def work_buffers(nbframe, npixel):
+    # gathered samples (uint8) and two float32 accumulators
+    buffers = getattr(_workspace, 'buffers', None)
+    if buffers is None or buffers[0].shape[0] < nbframe or \
+            buffers[0].shape[1] != npixel:
+        buffers = (np.empty((nbframe, npixel), dtype=np.uint8),
+                   np.empty((nbframe, npixel), dtype=np.float32),
+                   np.empty((nbframe, npixel), dtype=np.float32))
+        _workspace.buffers = buffers
+    return [buf[:nbframe] for buf in buffers]
+
+
+def to_frametime(value, origin=0):
+    # frame time (microseconds since 1970) of a datetime object (UTC if
+    # naive) or of a timedelta object from the frame time 'origin'
+    if isinstance(value, datetime.timedelta):
+        return int(origin) + value // datetime.timedelta(microseconds=1)
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return (value - datetime.datetime(1970, 1, 1)) // \
+        datetime.timedelta(microseconds=1)
+
+
+# Sonaris object of a worker process of the frame-parallel conversion
+# and shared-memory ring of output images
+_worker = None
+_ring = None
+
+
+def _init_worker(son, ring=None):
+    # the headers and the geometry are received once per worker process
+    global _worker, _ring
+    _worker = son
+    _worker.map_frames()
+    if ring is not None:
+        name, shape = ring
+        memory = shared_memory.SharedMemory(name=name)
+        _ring = (memory, np.ndarray(shape, dtype=np.uint8, buffer=memory.buf))
+
+
+def _remap_chunk(start, stop, slot=None):
+    frames = _worker.read_frames(start, stop)
+    if len(frames) == 0:
+        # all the frames of the chunk are damaged and skipped
+        if slot is None:
+            return np.empty((0, int(_worker.ny), int(_worker.nx)),
+                            dtype=np.uint8)
+        return 0
+    geometry = _worker.block_geometry(start)
+    if slot is None:
+        return _worker.remap_frames(frames, geometry=geometry)
+    # images written in a slot of the ring: only the count is sent back
+    _worker.remap_frames(frames, out=_ring[1][slot, :len(frames)],
+                         geometry=geometry)
+    return len(frames)
+
+
+def _encode_segment(start, stop, avi_file, batch):
+    _worker.write_movie(
+        _worker.remap_sequential(batch, start, stop), avi_file)
+    return avi_file
 
 
 class Sonaris(object):
     """
     The base class for the Sonar Aris Reader
     """
-    def __init__(self, aris_file, avi_file):
+    def __init__(self, aris_file, avi_file, cache_dir=None,
+                 index_sidecar=True):
         # input ARIS file name
         self.aris_file = aris_file
         # output AVI file name
         self.avi_file = avi_file
+        # optional directory for the on-disk cache of the sonar geometries
+        self.cache_dir = cache_dir
+        # write the frame index in a .idx sidecar file (see read_index)
+        self.index_sidecar = index_sidecar
+        # damaged frames (see check_frames): 'zero' (black images) or 'skip'
+        self.damaged = 'zero'
+        self.bad_frames = np.zeros(0, dtype=int)
+        # lookup tables of the sonar windows of the frames (see
+        # read_geometries): index of the table of each frame, or None if
+        # all the frames have the current geometry
+        self.geometries = []
+        self.geometry_index = None
+
+    @classmethod
+    def from_files(cls, aris_files, avi_file, cache_dir=None,
+                   index_sidecar=True):
+        # session of consecutive ARIS files converted into one AVI file
+        return Session(aris_files, avi_file, cache_dir, index_sidecar)
+
+    def __getstate__(self):
+        # the memory-mapped file and the video writer are not sent to
+        # other processes
+        state = self.__dict__.copy()
+        for name in ('frames', 'movie', 'vid'):
+            state.pop(name, None)
+        return state
 
     def read_file_header(self):
         try:
             with open(self.aris_file, 'rb') as f:
-                self.file_header = {}
-                # type de fichier
-                self.ftype = np.fromfile(f, dtype=np.uint8, count=3)
-                self.file_header['type'] =\
-                    ''.join([chr(item) for item in self.ftype])
-                # version
-                self.file_header['version'] =\
-                    np.fromfile(f, dtype=np.uint8, count=1)
-                # total frames in file
-                self.file_header['numframes'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                # initial recorded frame rate
-                self.file_header['framerate'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                # Non-zero if HF, zero if LF
-                self.file_header['resolution'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                # ARIS 3000 = 128/64, ARIS 1800 = 96/48, ARIS 1200 = 48
-                self.file_header['numbeams'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                # 1/Sample Period
-                self.file_header['samplerate'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                # number of range samples in each beam
-                self.file_header['sampleperchannel'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                # relative gain in dB:  0 - 40
-                self.file_header['receivergain'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                # image window start range in meters (code [0..31] in DIDSON)
-                self.file_header['windowstart'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                # image window length in meters  (code [0..3] in DIDSON)
-                self.file_header['windowlength'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                # non-zero = lens down (DIDSON) or lens up (ARIS),
-                # zero = opposite
-                self.file_header['reverse'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                # sonar serial number
-                self.file_header['serialnumber'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                # date that file was recorded
-                self.date =\
-                    np.fromfile(f, dtype=np.uint8, count=32)
-                self.file_header['strdate'] =\
-                    ''.join([chr(item) for item in self.date])
-                # user input to identify file in 256 characters
-                self.ids = np.fromfile(f, dtype=np.uint8, count=256)
-                self.file_header['idstring'] =\
-                    ''.join([chr(item) for item in self.ids])
-                # user-defined integer quantity
-                self.file_header['id1'] =\
-                    np.fromfile(f, dtype=np.int32, count=1)
-                # user-defined integer quantity
-                self.file_header['id2'] =\
-                    np.fromfile(f, dtype=np.int32, count=1)
-                # user-defined integer quantity
-                self.file_header['id3'] =\
-                    np.fromfile(f, dtype=np.int32, count=1)
-                # user-defined integer quantity
-                self.file_header['id4'] =\
-                    np.fromfile(f, dtype=np.int32, count=1)
-                # first frame number from source file
-                # (for DIDSON snippet files)
-                self.file_header['startframe'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                # last frame number from source file (for DIDSON snippet files)
-                self.file_header['endframe'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                # non-zero indicates time lapse recording
-                self.file_header['timelapse'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                # number of frames/seconds between recorded frames
-                self.file_header['recordinterval'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                # frames or seconds interval
-                self.file_header['radioseconds'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                # record every Nth frame
-                self.file_header['frameinterval'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                # see DDF_04 file format document
-                self.file_header['flags'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                # see DDF_04 file format document
-                self.file_header['auxflags'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                # sound velocity in water
-                self.file_header['sspd'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                # see DDF_04 file format document
-                self.file_header['flags3d'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                # DIDSON software version that recorded the file
-                self.file_header['softwareversion'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                # water temperature code:  0 = 5-15C, 1 = 15-25C, 2 = 25-35C
-                self.file_header['watertemperature'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                # salinity code:  0 = fresh, 1 = brackish, 2 = salt
-                self.file_header['salinity'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                # added for ARIS but not used
-                self.file_header['pulselength'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                # added for ARIS but not used
-                self.file_header['txmode'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                # reserved for future use
-                self.file_header['versionfgpa'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                # reserved for future use
-                self.file_header['versionpsuc'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                # frame index of frame used for thumbnail image of file
-                self.file_header['thumbnailfi'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                # total file size in bytes
-                self.file_header['watertemperature'] =\
-                    np.fromfile(f, dtype=np.uint64, count=1)
-                # reserved for future use
-                self.file_header['optionalheadersize'] =\
-                    np.fromfile(f, dtype=np.uint64, count=1)
-                # reserved for future use
-                self.file_header['optionaltailsize'] =\
-                    np.fromfile(f, dtype=np.uint64, count=1)
-                # DIDSON version minor
-                self.file_header['versionminor'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                # non-zero if telephoto lens
-                # (large lens, hi-res lens, big lens) is present
-                self.file_header['largelens'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                # free space for user
-                self.file_header['userassigned'] =\
-                    np.fromfile(f, dtype=np.uint8, count=568)
-                # lenght of header file
-                self.file_header['length'] = f.tell()
+                header = np.fromfile(f, dtype=FILE_HEADER, count=1)
         except IOError:
             print('Error ->read_file_header<- : unable to open the ARIS file!')
             return
-        f.close()
+        if len(header) == 0:
+            print('Error ->read_file_header<- : truncated ARIS file!')
+            return
+        self.file_header = decode_header(header[0])
+        # raw bytes of the character fields
+        self.ftype = header[0]['type']
+        self.date = header[0]['strdate']
+        self.ids = header[0]['idstring']
+        # lenght of header file, followed by the optional header (newer
+        # firmware) before the first frame
+        self.file_header['length'] = FILE_HEADER.itemsize + \
+            self.file_header['optionalheadersize']
         return
 
     def read_frame_header(self):
         try:
             with open(self.aris_file, 'rb') as f:
-                self.frame_header = {}
                 f.seek(self.file_header['length'])
-                self.frame_header['framenumber'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['frametime'] =\
-                    np.fromfile(f, dtype=np.uint64, count=1)
-                self.frame_header['version'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['status'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['sonartimestep'] =\
-                    np.fromfile(f, dtype=np.uint64, count=1)
-                self.frame_header['tsday'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['tshour'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['tsminute'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['tssecond'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['tshsecond'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['transmitmode'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['windowstart'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['windowlength'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['threshold'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['intensity'] =\
-                    np.fromfile(f, dtype=np.int32, count=1)
-                self.frame_header['receivergain'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['degc1'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['degc2'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['humidity'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['focus'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['battery'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['uservalue1'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['uservalue2'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['uservalue3'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['uservalue4'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['uservalue5'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['uservalue6'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['uservalue7'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['uservalue8'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['velocity'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['depth'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['altitude'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['pitch'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['pitchrate'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['roll'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['rollrate'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['heading'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['headingrate'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['compassheading'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['compasspitch'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['compassroll'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['latitude'] =\
-                    np.fromfile(f, dtype=np.float64, count=1)
-                self.frame_header['longitude'] =\
-                    np.fromfile(f, dtype=np.float64, count=1)
-                self.frame_header['sonarposition'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['configflags'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['beamtilt'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['targetrange'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['targetbearing'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['targetpresent'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['firmwareversion'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['flags'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['sourceframe'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['watertemp'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['timerperiod'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['sonarx'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['sonary'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['sonarz'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['sonarpan'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['sonartilt'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['sonarroll'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['panpnnl'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['tiltpnnl'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['rollpnnl'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['vehicletime'] =\
-                    np.fromfile(f, dtype=np.float64, count=1)
-                self.frame_header['timeggk'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['dateggk'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['qualityggk'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['numsatsggk'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['dopggk'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['ehtggk'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['heavetss'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['yeargps'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['monthgps'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['daygps'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['hourgps'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['minutegps'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['secondgps'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['hsecondgps'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['sonarpanoffset'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['sonartiltoffset'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['sonarrolloffset'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['sonarxoffset'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['sonaryoffset'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['sonarzoffset'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['tmatrix'] =\
-                    np.fromfile(f, dtype=np.float32, count=16)
-                self.frame_header['samplerate'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['accellx'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['accelly'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['accellz'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['pingmode'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['frequencyhilow'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['pulsewidth'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['cycleperiod'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['sampleperiod'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['transmitenable'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['framerate'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['soundspeed'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['samplesperbeam'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['enable150v'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['samplestartdelay'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['largelens'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['thesystemtype'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['sonarserianumber'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['encryptedkey'] =\
-                    np.fromfile(f, dtype=np.uint64, count=1)
-                self.frame_header['ariserrorflagsuint'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['missedpackets'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['arisappversion'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['available2'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['reorderedsamples'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['salinity'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['pressure'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['batteryvoltage'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['mainvoltage'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['switchvoltage'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['focusmotormoving'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['voltagechanging'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['focustimeoutfault'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['focusovercurrentfault'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['focusnotfoundfault'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['focusstalledfault'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['fpgatimeoutfault'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['fpgabusyfault'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['fpgastuckfault'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['cputempfault'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['psutempfault'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['watertempfault'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['humidityfault'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['pressurefault'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['voltagereadfault'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['voltagewritefault'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['focuscurrentposition'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['targetpan'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['targettilt'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['targetroll'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['panmotorerrorcode'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['tiltmotorerrorcode'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['rollmotorerrorcode'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['panabsposition'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['tiltabsposition'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['rollabsposition'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['panaccelx'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['panaccely'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['panaccelz'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['tiltaccelx'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['tiltaccely'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['tiltaccelz'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['rollaccelx'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['rollaccely'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['rollaccelz'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['appliedsettings'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['constrainedsettings'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['invalidsettings'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['enableinterpacketdelay'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['interpacketdelayperiod'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['uptime'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['arisappversionmajor'] =\
-                    np.fromfile(f, dtype=np.uint16, count=1)
-                self.frame_header['arisappversionminor'] =\
-                    np.fromfile(f, dtype=np.uint16, count=1)
-                self.frame_header['gotime'] =\
-                    np.fromfile(f, dtype=np.uint64, count=1)
-                self.frame_header['panvelocity'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['tiltvelocity'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['rollvelocity'] =\
-                    np.fromfile(f, dtype=np.float32, count=1)
-                self.frame_header['sentinel'] =\
-                    np.fromfile(f, dtype=np.uint32, count=1)
-                self.frame_header['userassigned'] =\
-                    np.fromfile(f, dtype=np.uint8, count=292)
-                self.frame_header['length'] =\
-                    f.tell() - self.file_header['length']
+                header = np.fromfile(f, dtype=FRAME_HEADER, count=1)
         except IOError:
             print('Error ->read_frame_header<- :'
                   ' unable to open the ARIS file!')
             return
-        f.close()
+        if len(header) == 0:
+            print('Error ->read_frame_header<- : no frame in the ARIS file!')
+            return
+        self.frame_header = decode_header(header[0])
+        self.frame_header['length'] = FRAME_HEADER.itemsize
         return
 
-    def extract_file_bin(self):
+    def read_frame_table(self):
+        # headers of all the frames decoded in one pass from the
+        # memory-mapped file: a columnar table (structured array) giving
+        # the true per-frame metadata, e.g. frame_table['windowstart']
+        self.map_frames()
+        if self.frames is None:
+            return
+        self.frame_table = np.array(self.frames['header'])
+        return
+
+    def frame_shape(self):
+        # (samples, beams) of the raw frames: samples per beam of the frame
+        # header when it is read, else of the file header
+        samples = getattr(self, 'frame_header', {}).get('samplesperbeam')
+        return (samples or self.file_header['sampleperchannel'],
+                self.file_header['numbeams'])
+
+    def frame_record(self):
+        # one frame of the ARIS file: frame header, raw samples and optional
+        # tail, so that the frames are read at their exact stride
+        fields = [('header', FRAME_HEADER),
+                  ('data', np.uint8, self.frame_shape())]
+        if self.file_header['optionaltailsize'] > 0:
+            fields.append(('tail', np.void,
+                           self.file_header['optionaltailsize']))
+        return np.dtype(fields)
+
+    def frame_count(self):
+        # number of frames to read: 'numframes' of the file header, but no
+        # more than the complete frames found on disk (truncated file), or
+        # all of them if the header was not updated (numframes of 0)
+        size = os.path.getsize(self.aris_file) - self.file_header['length']
+        ondisk = max(size, 0) // self.frame_record().itemsize
+        nbframe = self.file_header['numframes']
+        if nbframe == 0:
+            return ondisk
+        return min(nbframe, ondisk)
+
+    def map_frames(self):
+        # memory-mapped view of all the frames of the ARIS file: one record
+        # per frame made of the (skipped) frame header and the raw samples,
+        # paged in lazily by the OS and never copied until remapped
+        nbframe = self.frame_count()
+        self.frame_dtype = self.frame_record()
+        self.frames = None
         try:
-            with open(self.aris_file, 'rb') as f:
-                f.seek(self.file_header['length'])
-                self.movie = []
-                nbframe = self.file_header['numframes']
-                ix = self.file_header['numbeams']
-                iy = self.file_header['sampleperchannel']
-                framedim = self.file_header['numbeams'] * \
-                    self.file_header['sampleperchannel']
-                for i in range(0, nbframe[0]):
-                    f.seek(f.tell() + self.frame_header['length'])
-                    frame = np.fromfile(f, dtype=np.uint8, count=framedim[0])
-                    self.movie.append(frame)
+            self.frames = np.memmap(self.aris_file, dtype=self.frame_dtype,
+                                    mode='r',
+                                    offset=self.file_header['length'],
+                                    shape=(nbframe,))
         except IOError:
-            print('Error ->extract_file_bin<- : unable to open the ARIS file!')
+            print('Error ->map_frames<- : unable to open the ARIS file!')
             return
-        f.close()
-        self.movie = np.array(self.movie)
-        self.movie = self.movie.reshape(nbframe[0], iy[0], ix[0])
+        return
+
+    def check_frames(self):
+        # validation of the frame headers: a frame is damaged if its
+        # sentinel is wrong or if its frame number is out of order with the
+        # other frames (see ordered_frames, dropped frames are allowed);
+        # the indices of the damaged frames are kept in 'bad_frames' and
+        # the frames lost at the end of a truncated file are reported
+        self.map_frames()
+        if self.frames is None:
+            return
+        headers = self.frames['header']
+        valid = headers['sentinel'] == FRAME_SENTINEL
+        positions = np.flatnonzero(valid)
+        ordered = ordered_frames(headers['framenumber'][positions], positions)
+        valid[positions[~ordered]] = False
+        self.bad_frames = np.flatnonzero(~valid)
+        if len(self.frames) < self.file_header['numframes']:
+            print('Warning ->check_frames<- : truncated ARIS file, %d of %d'
+                  ' frames found' % (len(self.frames),
+                                     self.file_header['numframes']))
+        if len(self.bad_frames) > 0:
+            print('Warning ->check_frames<- : %d damaged frames (%s): %s'
+                  % (len(self.bad_frames),
+                     'skipped' if self.damaged == 'skip' else 'zero-filled',
+                     ' '.join([str(i) for i in self.bad_frames[:20]]) +
+                     (' ...' if len(self.bad_frames) > 20 else '')))
+        return
+
+    def read_frames(self, start, stop):
+        # raw samples of the frames [start, stop) of the memory map, the
+        # damaged frames (see check_frames) being zero-filled or skipped
+        frames = self.frames['data'][start:stop]
+        first, last = np.searchsorted(self.bad_frames, (start, stop))
+        if first == last:
+            return frames
+        return self.repair_frames(frames, np.arange(start, stop))
+
+    def repair_frames(self, frames, indices):
+        # raw samples of the frames 'indices', the damaged frames (see
+        # check_frames) being zero-filled or skipped
+        bad = np.isin(indices, self.bad_frames)
+        if not bad.any():
+            return frames
+        if self.damaged == 'skip':
+            return frames[~bad]
+        frames = np.array(frames)
+        frames[bad] = 0
+        return frames
+
+    def build_index(self):
+        # frame index (offset, frame number, time, window) of the frames
+        # of the memory map, from their headers
+        self.map_frames()
+        nbframe = 0 if self.frames is None else len(self.frames)
+        self.frame_index = np.zeros(nbframe, dtype=FRAME_INDEX)
+        if nbframe == 0:
+            return
+        headers = self.frames['header']
+        self.frame_index['offset'] = self.file_header['length'] + \
+            self.frame_dtype.itemsize * np.arange(nbframe, dtype=np.uint64)
+        for name in ('framenumber', 'frametime', 'windowstart',
+                     'windowlength'):
+            self.frame_index[name] = headers[name]
+        return
+
+    def read_index(self, write=True):
+        # frame index from the .idx sidecar file when it is still valid
+        # (same size and modification time of the ARIS file), else built
+        # from the ARIS file and, if 'write', saved in the sidecar file
+        if not hasattr(self, 'file_header'):
+            self.read_file_header()
+        if not hasattr(self, 'frame_header'):
+            self.read_frame_header()
+        stat = os.stat(self.aris_file)
+        filename = self.aris_file + '.idx'
+        try:
+            with np.load(filename) as sidecar:
+                if int(sidecar['size']) == stat.st_size and \
+                        float(sidecar['mtime']) == stat.st_mtime and \
+                        sidecar['index'].dtype == FRAME_INDEX:
+                    self.frame_index = sidecar['index']
+                    return
+        except (IOError, OSError, ValueError, KeyError):
+            pass
+        self.build_index()
+        if not write:
+            return
+        try:
+            tmpname = '%s.%d.tmp' % (filename, os.getpid())
+            with open(tmpname, 'wb') as f:
+                np.savez(f, index=self.frame_index, size=stat.st_size,
+                         mtime=stat.st_mtime)
+            os.replace(tmpname, filename)
+        except (IOError, OSError):
+            print('Warning ->read_index<- : unable to write ' + filename)
+        return
+
+    def frame_offset(self, i):
+        # position of the frame 'i' in the ARIS file (see read_index)
+        if not hasattr(self, 'frame_index'):
+            self.read_index(self.index_sidecar)
+        return int(self.frame_index['offset'][i])
+
+    def find_frame(self, frametime):
+        # first frame recorded at or after 'frametime' (see read_index)
+        if not hasattr(self, 'frame_index'):
+            self.read_index(self.index_sidecar)
+        return int(np.searchsorted(self.frame_index['frametime'], frametime))
+
+    def extract_file_bin(self):
+        # strided (zero-copy) view of the raw samples of all the frames
+        self.map_frames()
+        if self.frames is None:
+            return
+        self.movie = self.frames['data']
         return
 
     def lens_distorsion(self, nbeams, theta):
@@ -559,93 +774,552 @@ class Sonaris(object):
         return np.round(factor * (a[0] * theta**3 +
                         a[1] * theta**2 + a[2] * theta + a[3]) + 1)
 
-    def make_movie(self):
+    def block_bounds(self, batch, start, stop):
+        # ranges [i, j) of at most 'batch' frames covering [start, stop),
+        # cut where the sonar window changes (see read_geometries)
+        bounds = [start, stop]
+        if self.geometry_index is not None:
+            changes = np.flatnonzero(np.diff(
+                self.geometry_index[start:stop])) + start + 1
+            bounds = [start] + changes.tolist() + [stop]
+        return [(i, min(i + batch, last))
+                for first, last in zip(bounds[:-1], bounds[1:])
+                for i in range(first, last, batch)]
+
+    def block_geometry(self, i):
+        # geometry of the block of frames starting at the frame 'i' (None
+        # for the current geometry)
+        if self.geometry_index is None:
+            return None
+        return self.geometries[self.geometry_index[i]]
+
+    def iter_blocks(self, batch=1, start=0, stop=None):
+        # generator over the raw frames [start, stop) of the ARIS file, by
+        # blocks of at most 'batch' frames taken from the memory-mapped
+        # file, with the geometry of each block
+        self.map_frames()
+        if self.frames is None:
+            return
+        if stop is None:
+            stop = len(self.frames)
+        for i, j in self.block_bounds(batch, start, stop):
+            frames = self.read_frames(i, j)
+            if len(frames) > 0:
+                yield self.block_geometry(i), frames
+
+    def iter_frames(self, batch=1, start=0, stop=None):
+        # generator over the blocks of raw frames (see iter_blocks)
+        for _, frames in self.iter_blocks(batch, start, stop):
+            yield frames
+
+    def remap_frames(self, frames, out=None, geometry=None):
+        # beam interpolation and angular transform of a block of raw frames
+        # (frames, samples, beams) as one gather of sample pairs weighted by
+        # the remap operator, giving a (frames, ny, nx) block of images
+        # (written in 'out' if given). The remap operator is the one of
+        # 'geometry' if given, its images being resized to the current
+        # image size. The frames are remapped by sub-blocks of at most
+        # REMAP_BLOCK frames so that the work buffers stay small
+        if geometry is None:
+            geometry = self.geometry
+        index, weight = geometry['index'], geometry['weight']
+        nbframe = len(frames)
+        if out is None:
+            out = np.empty((nbframe, int(self.ny), int(self.nx)),
+                           dtype=np.uint8)
+        shape = int(geometry['ny']), int(geometry['nx'])
+        for first in range(0, nbframe, REMAP_BLOCK):
+            block = frames[first:first + REMAP_BLOCK]
+            count = len(block)
+            block = block.reshape(count, -1)
+            samples, outframes, work = work_buffers(count, index.shape[1])
+            np.take(block, index[0], axis=1, out=samples)
+            np.multiply(samples, weight[0], out=outframes)
+            np.take(block, index[1], axis=1, out=samples)
+            np.multiply(samples, weight[1], out=work)
+            np.add(outframes, work, out=outframes)
+            np.rint(outframes, out=outframes)
+            images = out[first:first + count]
+            if images.shape[1:] == shape:
+                np.copyto(images.reshape(count, -1), outframes,
+                          casting='unsafe')
+                continue
+            resized = images
+            images = np.empty((count,) + shape, dtype=np.uint8)
+            np.copyto(images.reshape(count, -1), outframes, casting='unsafe')
+            for image, outimage in zip(images, resized):
+                outimage[...] = resize(image, (out.shape[2], out.shape[1]))
+        return out
+
+    def remap_frame(self, inframe):
+        return self.remap_frames(inframe[np.newaxis])[0]
+
+    def open(self):
+        # headers, geometry, frame index, memory map and damaged frames of
+        # the ARIS file, read once before a random access to the frames;
+        # the frame index is read from the .idx sidecar file (written at
+        # the first access unless 'index_sidecar' is False)
+        if getattr(self, 'frames', None) is not None:
+            return
+        self.read_file_header()
+        self.read_frame_header()
+        self.angular_converter()
+        self.read_index(self.index_sidecar)
+        self.map_frames()
+        self.check_frames()
+        self.read_geometries()
+        return
+
+    def __len__(self):
+        self.open()
+        return len(self.frame_index)
+
+    def get_frame(self, i):
+        # remapped image of the frame 'i': only this frame is read from disk,
+        # at its position in the frame index (a damaged frame is black, or
+        # an IndexError if the damaged frames are skipped)
+        self.open()
+        i = range(len(self.frame_index))[i]
+        with open(self.aris_file, 'rb') as f:
+            f.seek(self.frame_offset(i))
+            record = np.fromfile(f, dtype=self.frame_dtype, count=1)
+        frames = self.repair_frames(record['data'], [i])
+        if len(frames) == 0:
+            raise IndexError('frame %d is damaged' % i)
+        return self.remap_frames(frames, geometry=self.block_geometry(i))[0]
+
+    def __getitem__(self, key):
+        # remapped image(s) of a frame, a slice or a list of frames
+        if isinstance(key, (int, np.integer)):
+            return self.get_frame(key)
+        self.open()
+        # frames read and remapped by chunks of REMAP_BLOCK frames into the
+        # output images (without the damaged frames if they are skipped)
+        indices = np.arange(len(self.frame_index))[key]
+        if self.damaged == 'skip':
+            indices = indices[~np.isin(indices, self.bad_frames)]
+        images = np.empty((len(indices), int(self.ny), int(self.nx)),
+                          dtype=np.uint8)
+        for first in range(0, len(indices), REMAP_BLOCK):
+            chunk = indices[first:first + REMAP_BLOCK]
+            out = images[first:first + len(chunk)]
+            frames = self.repair_frames(self.frames['data'][chunk], chunk)
+            if self.geometry_index is None:
+                self.remap_frames(frames, out=out)
+                continue
+            # frames of several sonar windows
+            for k, i in enumerate(chunk):
+                self.remap_frames(frames[k:k+1], out=out[k:k+1],
+                                  geometry=self.block_geometry(i))
+        return images
+
+    def remap_blocks(self, frames):
+        # generator over the remapped blocks of images of the blocks of raw
+        # frames, written in a reused output block (valid until the next)
+        outframes = np.empty((0, int(self.ny), int(self.nx)), dtype=np.uint8)
+        for block in frames:
+            if len(block) > len(outframes):
+                outframes = np.empty((len(block), int(self.ny), int(self.nx)),
+                                     dtype=np.uint8)
+            yield self.remap_frames(block, out=outframes[:len(block)])
+
+    def remap_sequential(self, batch=4, start=0, stop=None):
+        # generator over the remapped blocks of images of the frames
+        # [start, stop), each block with the geometry of its frames,
+        # written in a reused output block (valid until the next)
+        outframes = np.empty((batch, int(self.ny), int(self.nx)),
+                             dtype=np.uint8)
+        for geometry, block in self.iter_blocks(batch, start, stop):
+            yield self.remap_frames(block, out=outframes[:len(block)],
+                                    geometry=geometry)
+
+    def remap_parallel(self, workers, batch=4, shared=True, start=0,
+                       stop=None):
+        # generator over the remapped blocks of images of the frames
+        # [start, stop), computed by blocks of 'batch' frames in a pool of
+        # 'workers' processes and given back in order; the geometry is sent
+        # once to each worker and at most 2 blocks per worker are in flight.
+        # Workers read the raw frames from their own memory map and, if
+        # 'shared', write the images in a ring of shared-memory slots
+        # instead of sending them back pickled (each block is then valid
+        # until the next one is produced)
+        if stop is None:
+            stop = self.frame_count()
+        inflight = 2 * workers
+        ring = None
+        initargs = (self,)
+        if shared and shared_memory is not None:
+            shape = (inflight, batch, int(self.ny), int(self.nx))
+            ring = shared_memory.SharedMemory(create=True,
+                                              size=int(np.prod(shape)))
+            images = np.ndarray(shape, dtype=np.uint8, buffer=ring.buf)
+            initargs = (self, (ring.name, shape))
+            slots = deque(range(0, shape[0]))
+        pool = None
+        try:
+            # created in the try: the ring is released if the pool fails
+            pool = multiprocessing.Pool(workers, initializer=_init_worker,
+                                        initargs=initargs)
+            starts = deque(self.block_bounds(batch, start, stop))
+            pending = deque()
+            while starts or pending:
+                # keep the pool busy
+                while starts and len(pending) < inflight:
+                    first, last = starts.popleft()
+                    slot = slots.popleft() if ring is not None else None
+                    pending.append((slot, pool.apply_async(
+                        _remap_chunk, (first, last, slot))))
+                slot, result = pending.popleft()
+                if ring is None:
+                    yield result.get()
+                else:
+                    yield images[slot, :result.get()]
+                    slots.append(slot)
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+            if ring is not None:
+                del images
+                try:
+                    ring.close()
+                except BufferError:
+                    # a block is still referenced by the consumer
+                    pass
+                ring.unlink()
+
+    def remap_threaded(self, threads, batch=4, start=0, stop=None):
+        # generator over the remapped blocks of images of the frames
+        # [start, stop), as a pipeline: a reader thread loads the blocks of
+        # 'batch' raw frames from disk and submits them to a pool of
+        # 'threads' remap threads; the remapped blocks are given back in
+        # order to the consumer (the writer). The queue of blocks in flight
+        # is bounded so that a slow stage holds back the reader
+        # (backpressure)
+        remapped = Queue(maxsize=2 * threads)
+        halt = threading.Event()
+
+        def put(item):
+            while not halt.is_set():
+                try:
+                    remapped.put(item, timeout=0.1)
+                    return True
+                except Full:
+                    pass
+            return False
+
+        def read():
+            try:
+                for geometry, block in self.iter_blocks(batch, start, stop):
+                    # copy of the memory-mapped frames: disk reads are done
+                    # here and not in the remap threads
+                    block = np.array(block)
+                    if not put(pool.submit(self.remap_frames, block, None,
+                                           geometry)):
+                        return
+            except BaseException as error:
+                put(error)
+            finally:
+                put(None)
+
+        pool = ThreadPoolExecutor(max_workers=threads)
+        reader = threading.Thread(target=read)
+        reader.start()
+        try:
+            while True:
+                item = remapped.get()
+                if item is None:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item.result()
+        finally:
+            halt.set()
+            # unblock the reader if the consumer stopped early
+            while reader.is_alive():
+                try:
+                    remapped.get(timeout=0.1)
+                except Empty:
+                    pass
+            reader.join()
+            pool.shutdown(wait=True)
+
+    def encode_segments(self, segments, batch=4, start=0, stop=None):
+        # the frames [start, stop) are split into 'segments' ranges,
+        # converted and encoded in parallel (one process per segment) into
+        # temporary AVI files, then concatenated in order without
+        # re-encoding into the AVI file
+        if stop is None:
+            stop = self.frame_count()
+        if stop <= start:
+            # no frame: empty video, as written by the sequential conversion
+            self.write_movie([])
+            return
+        bounds = np.linspace(start, stop, segments + 1).astype(int)
+        tmpdir = tempfile.mkdtemp(
+            prefix='sonaris_',
+            dir=os.path.dirname(os.path.abspath(self.avi_file)))
+        try:
+            jobs = [(start, stop,
+                     os.path.join(tmpdir, 'segment_%04d.avi' % i), batch)
+                    for i, (start, stop) in enumerate(zip(bounds[:-1],
+                                                          bounds[1:]))
+                    if stop > start]
+            pool = multiprocessing.Pool(len(jobs), initializer=_init_worker,
+                                        initargs=(self,))
+            try:
+                filenames = pool.starmap(_encode_segment, jobs)
+            finally:
+                pool.terminate()
+                pool.join()
+            try:
+                concat_avi(filenames, self.avi_file)
+            except BaseException:
+                if os.path.isfile(self.avi_file):
+                    os.remove(self.avi_file)
+                raise
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+        return
+
+    def remap_stream(self, batch=4, workers=1, threads=0, start=0,
+                     stop=None):
+        # generator over the remapped blocks of images of the frames
+        # [start, stop) with a pool of 'workers' processes, a pipeline of
+        # 'threads' threads or in the current thread
+        if workers > 1:
+            return self.remap_parallel(workers, batch, True, start, stop)
+        if threads > 0:
+            return self.remap_threaded(threads, batch, start, stop)
+        return self.remap_sequential(batch, start, stop)
+
+    def write_movie(self, images, avi_file=None):
+        # encode the blocks of remapped images in the AVI file
+        if avi_file is None:
+            avi_file = self.avi_file
         format = "XVID"
         is_color = True
         vid = None
         size = None
         fourcc = VideoWriter_fourcc(*format)
         size = int(self.nx), int(self.ny)
-        nbframe = self.file_header['numframes']
         frameRate = self.frame_header['framerate']
-        nout = int(self.nout)
-        n = int(self.n)
-        m = int(self.m)
-        self.vid = VideoWriter(self.avi_file, fourcc, float(frameRate),
+        self.vid = VideoWriter(avi_file, fourcc, float(frameRate),
                                size, is_color)
-        for i in range(0, nbframe[0]):
-            inframe = self.movie[i, :, :]
-            inframe = np.flip(inframe, axis=1)
-            outframe = np.zeros((m, nout))
-            inframe = inframe.astype(float)
-            outframe[:, np.arange(0, nout, 4)] = inframe
-            outframe[:, np.arange(1, nout-3, 4)] = \
-                0.75 * inframe[:, 0:n-1] + 0.25 * inframe[:, 1:n]
-            outframe[:, np.arange(2, nout-2, 4)] = \
-                0.50 * inframe[:, 0:n-1] + 0.50 * inframe[:, 1:n]
-            outframe[:, np.arange(3, nout-1, 4)] = \
-                0.25 * inframe[:, 0:n-1] + 0.75 * inframe[:, 1:n]
-            # black fill
-            outframe[0, 0] = 0.
-            # angular transform and save
-            outframe = outframe.ravel(order='F')
-            outframe = outframe[self.svector-1]
-            outframe = outframe.reshape(int(self.ny), int(self.nx), order='F')
-            outframe = np.round(outframe)
-            outframe = outframe.astype(dtype=np.uint8)
-            frame = Image.fromarray(outframe)
-            frame = frame.convert('RGB')
-            img = np.array(frame)
-            self.vid.write(img)
-        self.vid.release()
+        # grey levels copied into the 3 channels of a reused color image
+        img = np.empty((int(self.ny), int(self.nx), 3), dtype=np.uint8)
+        try:
+            for block in images:
+                for outframe in block:
+                    cvtColor(outframe, COLOR_GRAY2BGR, dst=img)
+                    self.vid.write(img)
+        finally:
+            # the video is closed even when interrupted (see follow)
+            self.vid.release()
+        return
+
+    def make_movie(self, frames=None):
+        # 'frames' is an iterable of blocks of raw frames (see iter_frames);
+        # by default all the frames of the ARIS file are streamed by blocks
+        if frames is None:
+            self.write_movie(self.remap_sequential())
+            return
+        self.write_movie(self.remap_blocks(frames))
+        return
+
+    def follow_frames(self, poll=0.5, timeout=30., batch=4):
+        # generator over the blocks of raw frames of an ARIS file still
+        # being recorded: the file size is polled every 'poll' seconds and
+        # each block of at most 'batch' newly completed frames is read and
+        # given as soon as it is found on disk. Stops when the file has not
+        # grown for 'timeout' seconds
+        record = self.frame_record()
+        nbframe = 0
+        last = time.time()
+        with open(self.aris_file, 'rb') as f:
+            while True:
+                size = os.fstat(f.fileno()).st_size - \
+                    self.file_header['length']
+                count = min(max(size, 0) // record.itemsize - nbframe, batch)
+                if count > 0:
+                    f.seek(self.file_header['length'] +
+                           nbframe * record.itemsize)
+                    frames = np.fromfile(f, dtype=record, count=count)
+                    nbframe += len(frames)
+                    last = time.time()
+                    yield frames['data']
+                elif time.time() - last > timeout:
+                    return
+                else:
+                    time.sleep(poll)
+
+    def wait_size(self, size, poll=0.5, timeout=30.):
+        # wait until the ARIS file has at least 'size' bytes (True) or
+        # 'timeout' seconds have passed (False)
+        last = time.time()
+        while not os.path.isfile(self.aris_file) or \
+                os.path.getsize(self.aris_file) < size:
+            if time.time() - last > timeout:
+                return False
+            time.sleep(poll)
+        return True
+
+    def follow(self, poll=0.5, timeout=30., batch=4):
+        # live conversion of an ARIS file still being recorded: the frames
+        # are remapped and appended to the AVI file as they are completed
+        # on disk, within about 'poll' seconds of their recording. The
+        # video is closed when the file has not grown for 'timeout' seconds
+        # or on a keyboard interrupt
+        # wait for the file header, then for the first frame header
+        if not self.wait_size(FILE_HEADER.itemsize, poll, timeout):
+            print('Error ->follow<- : no ARIS file!')
+            return
+        self.read_file_header()
+        if not self.wait_size(self.file_header['length'] +
+                              FRAME_HEADER.itemsize, poll, timeout):
+            print('Error ->follow<- : no frame in the ARIS file!')
+            return
+        if self.file_header['version'] != 5:
+            print('Error: only ARIS v5 is supported')
+        self.read_frame_header()
+        self.angular_converter()
+        try:
+            self.make_movie(self.follow_frames(poll, timeout, batch))
+        except KeyboardInterrupt:
+            pass
         return
 
     def angular_converter(self):
-        nbframe = self.file_header['numframes']
-        frameRate = self.frame_header['framerate']
         minRange = self.frame_header['windowstart']
         maxRange = self.frame_header['windowstart'] + \
             self.frame_header['windowlength']
-        self.m = np.int32(self.file_header['sampleperchannel'])
-        self.n = np.int32(self.file_header['numbeams'])
-        nrows = self.m
+        self.m, self.n = [np.int32(size) for size in self.frame_shape()]
         self.nx = np.int32(np.round(0.1773 * self.m + 309))
         self.nout = 4 * self.n - 3
+        self.key, geometry = self.window_geometry(
+            minRange, self.frame_header['windowlength'])
+        self.set_geometry(geometry)
+        return
+
+    def window_geometry(self, windowstart, windowlength):
+        # key and geometry of a sonar window: lookup table already computed
+        # for this sonar configuration or computed and cached
+        key = geometry_key(self.n, self.m, windowstart, windowlength)
+        geometry = load_geometry(key, self.cache_dir)
+        if geometry is None:
+            self.compute_svector(windowstart, windowlength)
+            geometry = remap_operator(
+                key, self.svector.reshape(int(self.nx), int(self.ny)))
+            store_geometry(key, geometry, self.cache_dir)
+        return key, geometry
+
+    def read_geometries(self):
+        # sonar window of every frame from the frame headers: one geometry
+        # per distinct window (computed once and cached), chosen per block
+        # of frames during the conversion. The images of the other windows
+        # are resized to the current image size
+        self.geometries = [self.geometry]
+        self.geometry_index = None
+        if hasattr(self, 'frame_index'):
+            # windows of the frame index (see read_index)
+            headers = self.frame_index
+        else:
+            self.map_frames()
+            if self.frames is None:
+                return
+            headers = self.frames['header']
+        if len(headers) == 0:
+            return
+        windows = np.stack([headers['windowstart'],
+                            headers['windowlength']], axis=1)
+        # the damaged frames keep the current window
+        windows[self.bad_frames] = (self.frame_header['windowstart'],
+                                    self.frame_header['windowlength'])
+        values, index = np.unique(windows, axis=0, return_inverse=True)
+        if len(values) == 1:
+            return
+        current = self.geometry
+        self.geometries = [self.window_geometry(float(start),
+                                                float(length))[1]
+                           for start, length in values]
+        self.set_geometry(current)
+        self.geometry_index = index.ravel()
+        print('Warning ->read_geometries<- : %d sonar windows in the ARIS'
+              ' file' % len(values))
+        return
+
+    def compute_svector(self, windowstart=None, windowlength=None):
+        # lookup table of a sonar window (default: of the frame header)
+        if windowstart is None:
+            windowstart = self.frame_header['windowstart']
+            windowlength = self.frame_header['windowlength']
+        # the window ranges, the bottom of the image and the width of the
+        # window are computed in single precision like the ARIS header
+        # values they come from, the rest in double precision
+        minRange = np.float32(windowstart)
+        maxRange = minRange + np.float32(windowlength)
+        nrows = self.m
         half_angle = 14.  # for ARIS v5 only
         degtorad = np.pi / 180.  # conversion of degrees to radians
         radtodeg = 180. / np.pi  # conversion of radians to degrees
+        cos = np.float32(np.cos(half_angle * degtorad))
+        sin = np.float32(np.sin(half_angle * degtorad))
         # see drawing (distance from point scan touches
         # image boundary to origin)
-        d2 = maxRange * np.cos(half_angle * degtorad)
+        d2 = maxRange * cos
         # see drawing (bottom of image frame to r,theta origin in meters)
-        d3 = minRange * np.cos(half_angle*degtorad)
+        d3 = minRange * cos
         # precalcualtion of constants used in do loop below
-        c1 = (nrows - 1) / (maxRange - minRange)
+        c1 = (nrows - 1) / np.float64(maxRange - minRange)
         c2 = (self.nout - 1) / (2 * half_angle)
         # Ratio of pixel number to position in meters
-        gamma = self.nx / (2 * maxRange * np.sin(half_angle * degtorad))
+        gamma = self.nx / np.float64(np.float32(2) * maxRange * sin)
         # number of pixels in image in vertical direction
-        self.ny = np.int32(np.fix(gamma * (maxRange - d3) + 0.5))
-        # make vector and fill in later
-        self.svector = np.zeros((np.int32(self.nx*self.ny)), dtype=int)
+        self.ny = np.int32(np.fix(gamma * np.float64(maxRange - d3) + 0.5))
         ix = np.arange(1, self.nx + 1)  # pixels in x dimension
+        iy = np.arange(1, self.ny + 1)[:, np.newaxis]  # and in y dimension
         x = ((ix - 1) - self.nx / 2) / gamma  # convert from pixels to meters
-        for iy in range(1, int(self.ny)+1):
-            y = maxRange - (iy-1)/gamma  # convert from pixels to meters
-            r = np.sqrt(y*y + x*x)  # convert to polar cooridinates
-            theta = radtodeg * np.arctan2(x, y)  # theta is in degrees
-            binnum = np.fix((r - minRange) * c1 + 1.5)  # the rangebin number
-            # remove lens distortion using empirical formula
-            beamnum = self.lens_distorsion(self.nout, theta)
-            pos = (beamnum > 0) * (beamnum <= self.nout)*(binnum > 0) * \
-                (binnum <= nrows) * ((beamnum - 1) * nrows + binnum)
-            # The offset in this array is the pixel offset in the image array
-            self.svector[(ix-1) * self.ny + iy - 1] = pos
+        y = maxRange - (iy - 1) / gamma  # convert from pixels to meters
+        r = np.sqrt(y*y + x*x)  # convert to polar cooridinates
+        theta = radtodeg * np.arctan2(x, y)  # theta is in degrees
+        binnum = np.fix((r - minRange) * c1 + 1.5)  # the rangebin number
+        # remove lens distortion using empirical formula
+        beamnum = self.lens_distorsion(self.nout, theta)
+        pos = (beamnum > 0) * (beamnum <= self.nout)*(binnum > 0) * \
+            (binnum <= nrows) * ((beamnum - 1) * nrows + binnum)
+        # The offset in this array is the pixel offset in the image array
+        # (column-major order of the (ny, nx) image)
+        self.svector = pos.astype(int).ravel(order='F')
         # The value at this offset is the offset in the sample array
         self.svector[self.svector == 0] = 1
         return
 
-    def convert(self):
+    def set_geometry(self, geometry):
+        # lookup table and remap operator of the current sonar configuration
+        self.geometry = geometry
+        self.nx = np.int32(geometry['nx'])
+        self.ny = np.int32(geometry['ny'])
+        self.svector = geometry['svector'].ravel()
+        self.remap_index = geometry['index']
+        self.remap_weight = geometry['weight']
+        return
+
+    def frame_range(self, start=None, stop=None):
+        # frame indices [start, stop) of the bounds given as frame indices
+        # (negative values counted from the end), as datetime objects
+        # (frametime) or as timedelta objects from the first frame
+        bounds = []
+        for value in (start, stop):
+            if isinstance(value, (datetime.datetime, datetime.timedelta)):
+                if not hasattr(self, 'frame_index'):
+                    self.read_index(self.index_sidecar)
+                value = self.find_frame(
+                    to_frametime(value, self.frame_index['frametime'][0]))
+            bounds.append(value)
+        return slice(*bounds).indices(self.frame_count())[:2]
+
+    def convert(self, batch=4, workers=1, threads=0, segments=1, start=None,
+                stop=None, damaged='zero'):
         # check for file availability
         if os.path.isfile(self.aris_file) is False:
             print('Error ->' + self.aris_file + '<- ARIS file not found')
@@ -659,7 +1333,88 @@ class Sonaris(object):
         self.read_frame_header()
         # angular converter
         self.angular_converter()
-        # read raw data
-        self.extract_file_bin()
-        # convert frames and make video avi
-        self.make_movie()
+        # truncated file and damaged frames
+        self.damaged = damaged
+        self.check_frames()
+        # sonar window changes during the recording
+        self.read_geometries()
+        # frames to convert
+        start, stop = self.frame_range(start, stop)
+        # stream raw data by blocks of frames, convert and make video avi
+        if segments > 1:
+            self.encode_segments(segments, batch, start, stop)
+        else:
+            self.write_movie(self.remap_stream(batch, workers, threads, start,
+                                               stop))
+
+
+class Session(object):
+    """
+    A recording split into consecutive ARIS files converted into a single
+    AVI file (see Sonaris.from_files)
+    """
+    def __init__(self, aris_files, avi_file, cache_dir=None,
+                 index_sidecar=True):
+        # output AVI file name
+        self.avi_file = avi_file
+        # one reader per ARIS file
+        self.parts = []
+        for aris_file in aris_files:
+            if os.path.isfile(aris_file) is False:
+                print('Error ->' + aris_file + '<- ARIS file not found')
+                continue
+            son = Sonaris(aris_file, avi_file, cache_dir, index_sidecar)
+            son.read_file_header()
+            if son.file_header['version'] != 5:
+                print('Error: only ARIS v5 is supported')
+            son.read_frame_header()
+            self.parts.append(son)
+        # files in the order of their first frame
+        self.parts.sort(key=lambda son: son.frame_header['frametime'])
+
+    def __len__(self):
+        return len(self.parts)
+
+    def set_geometries(self):
+        # lookup table of the first file, shared by the files recorded
+        # with the same sonar configuration (the others get their own)
+        first = self.parts[0]
+        first.angular_converter()
+        for son in self.parts[1:]:
+            samples, beams = son.frame_shape()
+            key = geometry_key(beams, samples,
+                               son.frame_header['windowstart'],
+                               son.frame_header['windowlength'])
+            if key == first.key:
+                son.m, son.n, son.key = first.m, first.n, first.key
+                son.nout = first.nout
+                son.set_geometry(first.geometry)
+            else:
+                son.angular_converter()
+        return
+
+    def remap_stream(self, batch=4, workers=1, threads=0):
+        # generator over the remapped blocks of images of all the files,
+        # at the image size of the first file
+        first = self.parts[0]
+        size = int(first.nx), int(first.ny)
+        for son in self.parts:
+            for block in son.remap_stream(batch, workers, threads):
+                if block.shape[1:] != (size[1], size[0]):
+                    block = np.array([resize(image, size) for image in block])
+                yield block
+
+    def convert(self, batch=4, workers=1, threads=0, damaged='zero'):
+        # one AVI file for all the frames of the session, written by a
+        # single video writer (frame rate of the first file)
+        if len(self.parts) == 0:
+            print('Error ->Session<- no ARIS file to convert')
+            return
+        self.set_geometries()
+        for son in self.parts:
+            son.damaged = damaged
+            son.check_frames()
+            son.read_geometries()
+        self.parts[0].write_movie(self.remap_stream(batch, workers, threads),
+                                  self.avi_file)
+        return
@@ -0,0 +1,52 @@
+"""
+Validation of the frame headers (Sonaris.check_frames)
+
+Author(s) : Fabrice Zaoui (EDF R&D LNHE)
+
+Copyright EDF 2018
+"""
+import os
+import numpy as np
+from sonaris import Sonaris
+from sonaris.sonaris import FILE_HEADER, FRAME_HEADER
+
+ARIS_FILE = os.path.join(os.path.dirname(__file__), '..', 'video_test.aris')
+
+
+def damaged_frames(tmpdir, framenumbers):
+    # damaged frames of a copy of the test file with the given frame
+    # numbers {frame: framenumber}
+    with open(ARIS_FILE, 'rb') as f:
+        data = bytearray(f.read())
+    son = Sonaris(ARIS_FILE, None)
+    son.read_file_header()
+    son.read_frame_header()
+    size = son.frame_record().itemsize
+    for i, number in framenumbers.items():
+        header = np.frombuffer(data, dtype=FRAME_HEADER, count=1,
+                               offset=FILE_HEADER.itemsize + i * size)
+        header['framenumber'] = number
+    aris_file = os.path.join(str(tmpdir), 'test.aris')
+    with open(aris_file, 'wb') as f:
+        f.write(data)
+    son = Sonaris(aris_file, None)
+    son.read_file_header()
+    son.read_frame_header()
+    son.check_frames()
+    return son.bad_frames.tolist()
+
+
+def test_valid_file(tmpdir):
+    assert damaged_frames(tmpdir, {}) == []
+
+
+def test_out_of_order_frame(tmpdir):
+    # a single wrong frame number only marks its own frame
+    assert damaged_frames(tmpdir, {10: 50}) == [10]
+    assert damaged_frames(tmpdir, {10: 5}) == [10]
+    assert damaged_frames(tmpdir, {0: 1000}) == [0]
+
+
+def test_dropped_frame(tmpdir):
+    # frames 30.. renumbered after a dropped frame are all valid
+    assert damaged_frames(tmpdir, {i: i + 1 for i in range(30, 71)}) == []
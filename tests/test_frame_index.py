@@ -0,0 +1,37 @@
+"""
+Frame index of an ARIS file and its .idx sidecar file (Sonaris.read_index)
+
+Author(s) : Fabrice Zaoui (EDF R&D LNHE)
+
+Copyright EDF 2018
+"""
+import datetime
+import os
+import shutil
+from sonaris import Sonaris
+
+ARIS_FILE = os.path.join(os.path.dirname(__file__), '..', 'video_test.aris')
+
+
+def test_sidecar_written(tmpdir):
+    aris_file = os.path.join(str(tmpdir), 'test.aris')
+    shutil.copy(ARIS_FILE, aris_file)
+    son = Sonaris(aris_file, None)
+    son.open()
+    assert os.path.isfile(aris_file + '.idx')
+    # the index read back from the sidecar file is the same
+    again = Sonaris(aris_file, None)
+    again.open()
+    assert (again.frame_index == son.frame_index).all()
+
+
+def test_no_sidecar(tmpdir):
+    aris_file = os.path.join(str(tmpdir), 'test.aris')
+    shutil.copy(ARIS_FILE, aris_file)
+    son = Sonaris(aris_file, None, index_sidecar=False)
+    son.open()
+    assert len(son.frame_index) == son.frame_count()
+    # time bounds need the frame index too
+    son = Sonaris(aris_file, None, index_sidecar=False)
+    son.frame_range(datetime.timedelta(seconds=1))
+    assert not os.path.exists(aris_file + '.idx')